@@ -0,0 +1,10 @@
+import pyvisa
+
+from keithley2600 import Keithley2600
+
+if __name__ == '__main__':
+    rm = pyvisa.ResourceManager()
+    devs = rm.list_resources()
+    dev = rm.open_resource(devs[0])
+    smu = Keithley2600(dev)
+    smu.level_i = 1e-3
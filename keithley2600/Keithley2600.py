@@ -1,5 +1,38 @@
-import time
-from pyvisa import Resource
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from pyvisa import Resource
+
+
+def _parse_bool(s: str) -> bool:
+    # TSP prints flags as 0.00000e+00 or 1.00000e+00, so the first digit decides
+    return s.lstrip()[0] != '0'
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return _parse_bool(value)
+    return bool(value)
+
+
+def _to_int(value):
+    return int(float(value))
+
+
+class _BatchState(threading.local):
+    """
+    Commands collected in batch mode, kept per thread so that one thread never sends the batch of another
+    """
+
+    def __init__(self):
+        self.active = False
+        self.pending = []
 
 
 class Keithley2600:
@@ -7,12 +40,96 @@ class Keithley2600:
     Keithley 2600 Source Meter class. It contains basic functions to set up the device and make measurements.
 
     The commands and functions of the TSP language are exposed to Python.
-    The interface that this class provides is suitable only for making a single measurement per command.
-    For making multiple readings per measurement, this class has to be extended to use buffers.
+    The interface that this class provides is mostly suitable for making a single measurement per command.
+    Voltage sweeps with multiple readings are run on the device with `sweep_iv`.
+
+    The last written or read value of every attribute except the output state is cached, so reading a property back
+    does not query the device, and setting a property to its cached value is not written to the device again.
+    Properties can also be set to TSP constants given as strings, e.g. `smu.delay = 'smua.DELAY_AUTO'`;
+    their values are then read back from the device.
+    Commands written to the device directly through `smu` bypass the cache; call `reset_device` after them.
     """
 
-    def __init__(self, device: Resource, delay=0.1):
+    # TSP attributes reported by snapshot(), keyed by the name of the corresponding property
+    _STATE_ATTRIBUTES = {
+        'source_function': 'smua.source.func',
+        'output': 'smua.source.output',
+        'level_v': 'smua.source.levelv',
+        'level_i': 'smua.source.leveli',
+        'limit_v': 'smua.source.limitv',
+        'limit_i': 'smua.source.limiti',
+        'nplc': 'smua.measure.nplc',
+        'delay': 'smua.measure.delay',
+        'range_v': 'smua.measure.rangev',
+        'range_i': 'smua.measure.rangei',
+        'autorange_v': 'smua.measure.autorangev',
+        'autorange_i': 'smua.measure.autorangei',
+    }
+    # Conversion of the values of non-float attributes
+    _ATTRIBUTE_TYPES = {
+        'smua.source.func': _to_int,
+        'smua.source.output': _to_bool,
+        'smua.measure.autorangev': _to_bool,
+        'smua.measure.autorangei': _to_bool,
+    }
+    # Writing one of these attributes changes the other on the device, so its cached value is dropped
+    _COUPLED_ATTRIBUTES = {
+        'smua.measure.rangev': 'smua.measure.autorangev',
+        'smua.measure.rangei': 'smua.measure.autorangei',
+        'smua.measure.autorangev': 'smua.measure.rangev',
+        'smua.measure.autorangei': 'smua.measure.rangei',
+    }
+    # Always written: the source levels can be changed by the device, e.g. clamped or driven by the trigger model,
+    # and a skipped level write would leave the output at the wrong level; the autorange flags cache 2 as True
+    _UNGUARDED_ATTRIBUTES = ('smua.source.levelv', 'smua.source.leveli',
+                             'smua.measure.autorangev', 'smua.measure.autorangei')
+    # Number formatting for the commands: 15 significant digits reproduce any decimal value typed by the user
+    # and are shorter on the wire than 17 digits, which are beyond the resolution of the device anyway
+    _TPL_NUMBER = '%.15g'
+    _TPL_ASSIGNMENT = '%s = %.15g'
+    # Device data format and pyvisa datatype for the binary transfer of each reading dtype
+    _BINARY_FORMATS = {
+        np.dtype(np.float32): ('format.REAL32', 'f'),
+        np.dtype(np.float64): ('format.REAL64', 'd'),
+    }
+    # Short named functions for the measurements, defined once on the device so each query is parsed faster
+    _MEASURE_SCRIPT = '\n'.join([
+        'loadscript keithley2600py',
+        'function miv() print(smua.measure.iv()) end',
+        'function mir() print(smua.measure.r()) end',
+        'function mip() print(smua.measure.p()) end',
+        'endscript',
+        'keithley2600py()',
+    ])
+    # Never cached and so always queried and written, because the device can switch the output off on its own,
+    # e.g. on an interlock
+    _UNCACHED_ATTRIBUTES = ('smua.source.output',)
+    # Measure ranges may be changed by autoranging during any measurement
+    _VOLATILE_ATTRIBUTES = ('smua.measure.rangev', 'smua.measure.rangei')
+
+    def __init__(self, device: 'Resource', delay=0.1):
         self.smu = device
+        # Last known values of the TSP attributes, keyed by attribute name
+        self._cache = {}
+        # Format in which the device currently prints buffers, unknown until it is first set
+        self._data_format = None
+        # Commands collected in batch mode and not yet sent to the device
+        self._batch_state = _BatchState()
+        self._closed = False
+        # True while nothing has been changed on the device since the last reset
+        self._freshly_reset = False
+        # Background measurements run one at a time; the lock keeps their I/O from interleaving with other calls
+        self._executor = None
+        self._lock = threading.RLock()
+        # TSP terminates every response with a newline; a larger chunk size lets buffer dumps arrive in fewer reads
+        if hasattr(device, 'read_termination'):
+            device.read_termination = '\n'
+        if hasattr(device, 'write_termination'):
+            device.write_termination = '\n'
+        if hasattr(device, 'chunk_size'):
+            device.chunk_size = 102400
+        self.set_precision(6)
+        self._write(self._MEASURE_SCRIPT)
         self.reset_device()
         self.default_setup()
         self.delay = delay
@@ -22,45 +139,340 @@ class Keithley2600:
         Get single resistance measurement
         :return: resistance, Ohm
         """
-        response =self.smu.query('print(smua.measure.r())')
-        resistance = float(response.strip())
+        with self._lock:
+            self._forget_volatile()
+            resistance, = self._query_values('mir()')
         return resistance
 
     def measure_iv(self):
         """
         Get a single pair of the current and voltage measurement
+
+        The query returns only when the measurement has completed on the device, so no extra wait is needed.
         :return: current, A; voltage, V
         """
-        self.smu.write("ireading, vreading = smua.measure.iv()")
-        time.sleep(self.delay)
-        response = self.smu.query("printnumber(ireading,vreading)").split(",")
-        i = float(response[0])
-        v = float(response[1])
+        with self._lock:
+            self._forget_volatile()
+            i, v = self._query_values('miv()')
         return i, v
 
+    def measure_iv_async(self) -> Future:
+        """
+        Start a measurement of the current and voltage pair in a background thread
+
+        Other work can be done while the device integrates the measurement. Commands collected in a batch by the
+        calling thread are not sent by the background measurement.
+        :return: future of current, A; voltage, V
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(self.measure_iv)
+
     def measure_power(self):
         """
         Get single power measurement
         :return: power, W
         """
-        response = self.smu.query('print(smua.measure.p())')
-        power = float(response.strip())
+        with self._lock:
+            self._forget_volatile()
+            power, = self._query_values('mip()')
         return power
 
+    def sweep_iv(self, voltages: List[float], nplc=1, dtype=np.float32,
+                 binary=True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sweep the voltage output through a list of levels and measure the current and voltage at each level
+
+        The sweep runs on the device in one script. All the readings are then printed from the buffers with one command
+        and transferred in a single read, instead of one query per level.
+        The output has to be switched on before the sweep. After the sweep the output returns to the source level
+        that was set before it.
+        :param voltages: voltage levels, V
+        :param nplc: number of power line cycles for each measurement
+        :param dtype: numpy.float32 or numpy.float64, the readings are transferred from the device with this precision
+        :param binary: transfer the readings in binary format, otherwise in ASCII
+        :return: contiguous arrays of dtype: currents, A; voltages, V
+        """
+        self._binary_format(dtype)
+        n = len(voltages)
+        if n == 0:
+            return np.empty(0, dtype=dtype), np.empty(0, dtype=dtype)
+        setup = {'smua.source.func': 1, 'smua.measure.nplc': nplc}
+        script = [self._assignment(attr, value) for attr, value in setup.items()] + [
+            'smua.nvbuffer1.clear()',
+            'smua.nvbuffer2.clear()',
+            'smua.trigger.source.listv({' + ','.join([self._TPL_NUMBER % v for v in voltages]) + '})',
+            'smua.trigger.source.action = smua.ENABLE',
+            'smua.trigger.measure.iv(smua.nvbuffer1, smua.nvbuffer2)',
+            'smua.trigger.measure.action = smua.ENABLE',
+            'smua.trigger.endsweep.action = smua.SOURCE_IDLE',
+            'smua.trigger.arm.count = 1',
+            f'smua.trigger.count = {n}',
+            'smua.trigger.initiate()',
+            'waitcomplete()',
+        ]
+        self._forget_volatile()
+        self._write('\n'.join(script))
+        self._remember(setup)
+        # The trigger model drives the source level, so it is read back from the device next time
+        self._cache.pop('smua.source.levelv', None)
+        readings = self._read_buffers(n, 'smua.nvbuffer1', 'smua.nvbuffer2', dtype=dtype, binary=binary)
+        # The readings are interleaved; transposing and copying puts each quantity in a contiguous row
+        current, voltage = readings.reshape(n, 2).T.copy()
+        return current, voltage
+
+    def snapshot(self):
+        """
+        Get the state of all the device attributes in a single query
+        :return: dictionary of the attribute values, keyed by property name
+        """
+        values = self._query_many(list(self._STATE_ATTRIBUTES.values()))
+        state = {}
+        for (name, attr), value in zip(self._STATE_ATTRIBUTES.items(), values):
+            state[name] = self._ATTRIBUTE_TYPES.get(attr, float)(value)
+            self._store(attr, state[name])
+        return state
+
+    def begin_batch(self):
+        """
+        Collect the following writes to the device instead of sending them one by one, until `end_batch`
+
+        The collected commands are sent in a single write by `flush`, which is also done before every query.
+        Every call has to be paired with `end_batch`, otherwise later writes are held back; prefer `batch`.
+        Batches are collected per thread.
+        """
+        self._batch_state.active = True
+
+    def end_batch(self):
+        """
+        Stop collecting writes and send the collected commands to the device in a single write
+        """
+        self._batch_state.active = False
+        self.flush()
+
+    def flush(self):
+        """
+        Send the commands collected in batch mode by the calling thread to the device in a single write
+        """
+        pending = self._batch_state.pending
+        with self._lock:
+            if pending:
+                self.smu.write('\n'.join(pending))
+                pending.clear()
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that sends all the writes made inside it to the device in a single write:
+
+        with smu.batch():
+            smu.level_v = 1
+            smu.nplc = 5
+        """
+        if self._batch_state.active:
+            yield self
+            return
+        self.begin_batch()
+        try:
+            yield self
+        finally:
+            self.end_batch()
+
+    def _write(self, command):
+        """
+        Send a command to the device, or collect it in batch mode
+        :param command: TSP command
+        """
+        with self._lock:
+            if self._batch_state.active:
+                self._batch_state.pending.append(command)
+            else:
+                self.smu.write(command)
+
+    def _query(self, command):
+        """
+        Send the collected commands and then a query to the device
+        :param command: TSP command that prints the response
+        :return: response
+        """
+        with self._lock:
+            self.flush()
+            return self.smu.query(command)
+
+    def _query_values(self, command):
+        """
+        Send the collected commands and then a query of numeric values to the device
+        :param command: TSP command that prints the values
+        :return: list of the values
+        """
+        with self._lock:
+            self.flush()
+            # TSP print separates the values with tabs
+            return self.smu.query_ascii_values(command, converter='f', separator='\t')
+
+    def _apply(self, assignments: dict):
+        """
+        Assign several TSP attributes with a single write
+        :param assignments: values keyed by TSP attribute name
+        """
+        self._write('\n'.join([self._assignment(attr, value) for attr, value in assignments.items()]))
+        self._remember(assignments)
+
+    def _assignment(self, attr, value):
+        """
+        Format the assignment of a TSP attribute
+        :param attr: TSP attribute name
+        :param value: number, or TSP expression such as smua.DELAY_AUTO, which is sent as it is
+        :return: TSP command
+        """
+        if isinstance(value, str):
+            return f'{attr} = {value}'
+        return self._TPL_ASSIGNMENT % (attr, value)
+
+    def _remember(self, assignments: dict):
+        """
+        Update the cache after the TSP attributes have been assigned on the device
+        :param assignments: values keyed by TSP attribute name
+        """
+        self._freshly_reset = False
+        for attr, value in assignments.items():
+            self._cache.pop(self._COUPLED_ATTRIBUTES.get(attr), None)
+            if isinstance(value, str):
+                # The value of a TSP expression is only known to the device
+                self._cache.pop(attr, None)
+            else:
+                self._store(attr, self._ATTRIBUTE_TYPES.get(attr, float)(value))
+
+    def _store(self, attr, value):
+        """
+        Cache the value of a TSP attribute, unless the attribute is never cached
+        :param attr: TSP attribute name
+        :param value: attribute value
+        """
+        if attr not in self._UNCACHED_ATTRIBUTES:
+            self._cache[attr] = value
+
+    def _get_attribute(self, attr):
+        """
+        Get the value of a TSP attribute, querying the device only if the value is not cached
+        :param attr: TSP attribute name
+        :return: attribute value
+        """
+        if attr in self._cache:
+            return self._cache[attr]
+        if attr in self._ATTRIBUTE_TYPES:
+            value = self._ATTRIBUTE_TYPES[attr](self._query(f'print({attr})'))
+        else:
+            value, = self._query_values(f'print({attr})')
+        self._store(attr, value)
+        return value
+
+    def _set_attribute(self, attr, value):
+        """
+        Set the value of a TSP attribute and remember it
+
+        Nothing is written if the attribute already has this value in the cache. Floats are compared with a relative
+        tolerance of 1e-12, so values that differ only by rounding are not written again.
+        :param attr: TSP attribute name
+        :param value: attribute value
+        """
+        if attr in self._cache and attr not in self._UNGUARDED_ATTRIBUTES and not isinstance(value, str):
+            cached = self._cache[attr]
+            parse = self._ATTRIBUTE_TYPES.get(attr)
+            if parse is not None:
+                unchanged = cached == parse(value)
+            else:
+                unchanged = math.isclose(cached, value, rel_tol=1e-12)
+            if unchanged:
+                return
+        self._apply({attr: value})
+
+    def _forget_volatile(self):
+        """
+        Drop the cached values of the attributes that the device may change on its own
+        """
+        with self._lock:
+            for attr in self._VOLATILE_ATTRIBUTES:
+                self._cache.pop(attr, None)
+
+    def _set_data_format(self, data_format):
+        """
+        Set the format in which the device prints buffers, if it is not already set
+        :param data_format: TSP data format, e.g. format.REAL32
+        """
+        if self._data_format != data_format:
+            self._write(f'format.data = {data_format}\nformat.byteorder = format.LITTLEENDIAN')
+            self._data_format = data_format
+
+    def _binary_format(self, dtype):
+        """
+        Get the device data format and pyvisa datatype for transferring readings of a dtype
+        :param dtype: numpy.float32 or numpy.float64
+        :return: TSP data format; pyvisa datatype
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in self._BINARY_FORMATS:
+            raise ValueError(f'Unsupported dtype of readings: {dtype}')
+        return self._BINARY_FORMATS[dtype]
+
+    def _read_buffers(self, n, *buffers, dtype=np.float32, binary=True):
+        """
+        Read the first readings of the buffers
+        :param n: number of readings to read from each buffer
+        :param buffers: TSP buffer names
+        :param dtype: numpy.float32 or numpy.float64
+        :param binary: transfer the readings in binary format, otherwise in ASCII
+        :return: array of the readings, interleaved between the buffers
+        """
+        data_format, datatype = self._binary_format(dtype) if binary else ('format.ASCII', None)
+        readings = ', '.join(f'{buffer}.readings' for buffer in buffers)
+        with self._lock:
+            self._set_data_format(data_format)
+            if not binary:
+                # One line, so that the precision is restored in the same chunk and other prints keep full precision
+                response = self._query(f'local precision = format.asciiprecision; '
+                                       f'format.asciiprecision = {self._buffer_precision}; '
+                                       f'printbuffer(1, {n}, {readings}); '
+                                       f'format.asciiprecision = precision')
+                return np.fromstring(response, dtype=dtype, sep=',')
+            self._write(f'printbuffer(1, {n}, {readings})')
+            self.flush()
+            return self.smu.read_binary_values(datatype=datatype, is_big_endian=False, container=np.ndarray,
+                                               data_points=n * len(buffers))
+
+    def _query_many(self, tsp_exprs: List[str]) -> List[float]:
+        """
+        Evaluate several TSP expressions in a single round trip
+        :param tsp_exprs: TSP expressions with numeric values
+        :return: values of the expressions in the same order
+        """
+        return self._query_values('print(' + ','.join(tsp_exprs) + ')')
+
+    def set_precision(self, digits):
+        """
+        Set the number of significant digits of the buffer readings that are transferred in ASCII format
+
+        Single readings and attribute values are always printed with full precision.
+        6 digits are within the accuracy of the device and take half the bytes of the default 14-digit format.
+        :param digits: number of significant digits, 1 to 16
+        """
+        self._buffer_precision = int(digits)
+
     def reset_device(self):
         """
         Reset the device to the default state
         :return:
         """
-        self.smu.write("smua.reset()")
+        self._write("smua.reset()")
+        self._cache.clear()
+        self._freshly_reset = True
 
     def device_id(self):
         """
         Get the device name, model and serial number
         :return: string
         """
-        self.smu.write("print(smua.idn())")
-        response = self.smu.read()
+        response = self._query("print(smua.idn())")
         return response
 
     @property
@@ -69,8 +481,7 @@ class Keithley2600:
         Get the current state of the output (On or Off)
         :return True if switched on, False if switch off
         """
-        state = self.smu.query('print(smua.source.output)')
-        return bool(int(float(state.strip())))
+        return self._get_attribute('smua.source.output')
 
     @output.setter
     def output(self, flag):
@@ -78,7 +489,7 @@ class Keithley2600:
         Turn output on or off
         :param switch: True to switch on, False to switch off
         """
-        self.smu.write(f'smua.source.output = {int(flag)}')
+        self._set_attribute('smua.source.output', int(flag))
 
     def default_setup(self):
         """
@@ -90,16 +501,17 @@ class Keithley2600:
         - output off
         :return:
         """
-        # self.smu.write("smua.source.func = smua.OUTPUT_DCVOLTS")
-        # self.smu.write("smua.source.levelv = 0.0")
-        # self.smu.write("smua.source.autorangev = smua.AUTORANGE_ON")
-        # self.smu.write("smua.measure.autorangei = smua.AUTORANGE_ON")
-        # self.smu.write("smua.source.output = smua.OUTPUT_OFF")
-        self.source_function = 1
-        self.level_v = 0
-        self.autorange_i = 1
-        self.autorange_v = 1
-        self.output = False
+        # smua.reset() already sets a DC voltage source at 0 V, measure autorange on for current and voltage
+        # and the output off, so right after a reset there is nothing left to write
+        if self._freshly_reset:
+            return
+        self._apply({
+            'smua.source.func': 1,
+            'smua.source.levelv': 0,
+            'smua.measure.autorangei': 1,
+            'smua.measure.autorangev': 1,
+            'smua.source.output': 0,
+        })
 
     def setup_for_resistance_measurement(self):
         """
@@ -113,24 +525,17 @@ class Keithley2600:
         - current range = 1 mA
         :return:
         """
-        # self.smu.write('*RST')
-        # self.smu.write('smua.reset()')
-        # self.smu.write('smua.source.func = smua.OUTPUT_DCAMPS')
-        # self.smu.write('smua.source.leveli = 1e-3')
-        # self.smu.write('smua.measure.autorangev = smua.AUTORANGE_ON')
-        # self.smu.write('smua.measure.nplc = 5')
-        # self.smu.write('smua.measure.delay = 0.1')
-        # self.smu.write('smua.measure.rangev = 20')
-        # self.smu.write('smua.measure.rangei = 1e-3')
-        self.smu.write('smua.measure.r(smua.nvbuffer1)')
-        self.reset_device()
-        self.source_function = 0
-        self.level_i = 1e-3
-        self.autorange_v = 1
-        self.nplc = 5
-        self.delay = 0.1
-        self.range_v = 20
-        self.range_i = 1e-3
+        if not self._freshly_reset:
+            self.reset_device()
+        self._apply({
+            'smua.source.func': 0,
+            'smua.source.leveli': 1e-3,
+            'smua.measure.autorangev': 1,
+            'smua.measure.nplc': 5,
+            'smua.measure.delay': 0.1,
+            'smua.measure.rangev': 20,
+            'smua.measure.rangei': 1e-3,
+        })
 
     def setup_for_IV_measurement(self, iLimit, NPLC):
         """
@@ -144,29 +549,24 @@ class Keithley2600:
         :param NPLC: number of power line cycles
         :return:
         """
-        # self.smu.write("*RST")
-        # self.smu.write("smua.source.func = smua.OUTPUT_DCVOLTS")
-        # self.smu.write("smua.source.levelv = 0.0")
-        # self.smu.write("smua.source.autorangev = smua.AUTORANGE_ON")
-        # self.smu.write("smua.measure.autorangei = smua.AUTORANGE_ON")
-        # self.set_i_limit(iLimit)
-        # self.set_NPLC(NPLC)
-        self.reset_device()
-        self.source_function = 1
-        self.level_v = 0
-        self.autorange_i = 1
-        self.autorange_v = 1
-        self.limit_i = iLimit
-        self.nplc = NPLC
+        if not self._freshly_reset:
+            self.reset_device()
+        self._apply({
+            'smua.source.func': 1,
+            'smua.source.levelv': 0,
+            'smua.measure.autorangei': 1,
+            'smua.measure.autorangev': 1,
+            'smua.source.limiti': iLimit,
+            'smua.measure.nplc': NPLC,
+        })
 
     @property
     def source_function(self):
         """
         Get the output function of the source. Can be either 1 (voltage output) or 0 (current output)
-        :return: string
+        :return: output function
         """
-        response = self.smu.query('print(smua.source.func)')
-        return response
+        return self._get_attribute('smua.source.func')
 
     @source_function.setter
     def source_function(self, func):
@@ -174,7 +574,7 @@ class Keithley2600:
         Set the output function of the source.
         :param func: 1 for voltage output, 0 for current output
         """
-        self.smu.write(f'smua.source.func = {func}')
+        self._set_attribute('smua.source.func', func)
 
     @property
     def nplc(self):
@@ -186,8 +586,7 @@ class Keithley2600:
         is 16.67 ms (1/60) and 1 PLC for 50 Hz is 20 ms (1/50).
         :return: number of power line cycles
         """
-        response = self.smu.query('print(smua.measure.nplc)')
-        return float(response.strip())
+        return self._get_attribute('smua.measure.nplc')
 
     @nplc.setter
     def nplc(self, NPLC):
@@ -195,16 +594,17 @@ class Keithley2600:
         Set the integration aperture for measurements (number of power line cycles to average over)
         :param NPLC: number of power line cycles
         """
-        self.smu.write(f'smua.measure.nplc = {NPLC}')
+        self._set_attribute('smua.measure.nplc', NPLC)
 
     @property
     def delay(self):
         """
         Get the delay between measurements
+
+        The delay is applied by the device before each measurement, so it is the place to add settling time.
         :return: delay, s
         """
-        response = self.smu.query('print(smua.measure.delay)')
-        return float(response.strip())
+        return self._get_attribute('smua.measure.delay')
 
     @delay.setter
     def delay(self, delay):
@@ -212,7 +612,7 @@ class Keithley2600:
         Set the delay between measurements
         :param delay: delay, s
         """
-        self.smu.write(f'smua.measure.delay = {delay}')
+        self._set_attribute('smua.measure.delay', delay)
 
     @property
     def range_i(self):
@@ -220,8 +620,7 @@ class Keithley2600:
         Get the value of the current measurement range
         :return: range limit, A
         """
-        response = self.smu.query('print(smua.measure.rangei)')
-        return float(response.strip())
+        return self._get_attribute('smua.measure.rangei')
 
     @range_i.setter
     def range_i(self, i_range):
@@ -229,7 +628,7 @@ class Keithley2600:
         Set the current measurement range
         :param i_range: range limit, A
         """
-        self.smu.write(f'smua.measure.rangei = {i_range}')
+        self._set_attribute('smua.measure.rangei', i_range)
 
     @property
     def range_v(self):
@@ -237,8 +636,7 @@ class Keithley2600:
         Get the value of the voltage measurement range
         :return: range limit, V
         """
-        response = self.smu.query('print(smua.measure.rangev)')
-        return float(response.strip())
+        return self._get_attribute('smua.measure.rangev')
 
     @range_v.setter
     def range_v(self, v_range):
@@ -246,7 +644,7 @@ class Keithley2600:
         Set the voltage measurement range
         :param v_range: range limit, V
         """
-        self.smu.write(f'smua.measure.rangev = {v_range}')
+        self._set_attribute('smua.measure.rangev', v_range)
 
     @property
     def autorange_i(self):
@@ -254,8 +652,7 @@ class Keithley2600:
         Get the autorange state of the current measurement
         :return: autorange state
         """
-        response = self.smu.query('print(smua.measure.autorangei)')
-        return bool(int(float(response.strip())))
+        return self._get_attribute('smua.measure.autorangei')
 
     @autorange_i.setter
     def autorange_i(self, autorange):
@@ -268,7 +665,7 @@ class Keithley2600:
         range
         :param autorange: autorange state
         """
-        self.smu.write(f'smua.measure.autorangei = {autorange}')
+        self._set_attribute('smua.measure.autorangei', autorange)
 
     @property
     def autorange_v(self):
@@ -276,8 +673,7 @@ class Keithley2600:
         Get the autorange state of the voltage measurement
         :return: autorange state
         """
-        response = self.smu.query('print(smua.measure.autorangev)')
-        return bool(int(float(response.strip())))
+        return self._get_attribute('smua.measure.autorangev')
 
     @autorange_v.setter
     def autorange_v(self, autorange):
@@ -289,7 +685,7 @@ class Keithley2600:
         - 2 to set the measure range automatically to the limit
         :param autorange: autorange state
         """
-        self.smu.write(f'smua.measure.autorangev = {autorange}')
+        self._set_attribute('smua.measure.autorangev', autorange)
 
     @property
     def level_v(self):
@@ -297,8 +693,7 @@ class Keithley2600:
         Get the voltage output level
         :return: voltage level, V
         """
-        response = self.smu.query('print(smua.source.levelv)')
-        return float(response.strip())
+        return self._get_attribute('smua.source.levelv')
 
     @level_v.setter
     def level_v(self, v_level):
@@ -306,7 +701,7 @@ class Keithley2600:
         Set the voltage output level
         :param v_level: voltage level, V
         """
-        self.smu.write(f'smua.source.levelv = {v_level}')
+        self._set_attribute('smua.source.levelv', v_level)
 
     @property
     def level_i(self):
@@ -314,8 +709,7 @@ class Keithley2600:
         Get the current output level
         :return: current level, A
         """
-        response = self.smu.query('print(smua.source.leveli)')
-        return float(response.strip())
+        return self._get_attribute('smua.source.leveli')
 
     @level_i.setter
     def level_i(self, i_level):
@@ -323,7 +717,7 @@ class Keithley2600:
         Set the current output level
         :param i_level: current level, A
         """
-        self.smu.write(f'smua.source.leveli = {i_level}')
+        self._set_attribute('smua.source.leveli', i_level)
 
     @property
     def limit_i(self):
@@ -331,8 +725,7 @@ class Keithley2600:
         Get the limit of the current ouput
         :return: current limit, A
         """
-        response = self.smu.query('print(smua.source.limiti)')
-        return float(response.strip())
+        return self._get_attribute('smua.source.limiti')
 
     @limit_i.setter
     def limit_i(self, i_limit):
@@ -340,7 +733,7 @@ class Keithley2600:
         Set the limit of the current output
         :param i_limit: current limit, A
         """
-        self.smu.write(f'smua.source.limiti = {i_limit}')
+        self._set_attribute('smua.source.limiti', i_limit)
 
     @property
     def limit_v(self):
@@ -348,8 +741,7 @@ class Keithley2600:
         Get the limit of the voltage output
         :return: voltage limit, V
         """
-        response = self.smu.query('print(smua.source.limitv)')
-        return float(response.strip())
+        return self._get_attribute('smua.source.limitv')
 
     @limit_v.setter
     def limit_v(self, v_limit):
@@ -357,19 +749,50 @@ class Keithley2600:
         Set the limit of the voltage output
         :param v_limit: voltage limit, V
         """
-        self.smu.write(f'smua.source.limitv = {v_limit}')
+        self._set_attribute('smua.source.limitv', v_limit)
 
-    def __del__(self):
-        self.output = False
-        self.reset_device()
-        self.smu.close()
+    def switch_off(self):
+        """
+        Switch the output off and reset the device in a single write, e.g. to stop in an emergency
+
+        The commands are sent immediately, together with any collected ones, even inside a batch.
+        """
+        with self._lock, self.batch():
+            self._write('smua.source.output = 0')
+            self.reset_device()
+            self.flush()
+
+    def close(self):
+        """
+        Switch the output off, reset the device and close the connection
 
+        Calling it again has no effect. If the device is unreachable, the connection is closed without raising.
+        """
+        from pyvisa import VisaIOError
+
+        if self._closed:
+            return
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._batch_state.active = False
+        try:
+            try:
+                self.switch_off()
+            finally:
+                self.smu.close()
+        except VisaIOError:
+            pass
+
+    def __enter__(self):
+        return self
 
-if __name__ == '__main__':
-    import pyvisa
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
-    rm = pyvisa.ResourceManager()
-    devs = rm.list_resources()
-    dev = rm.open_resource(devs[0])
-    smu = Keithley2600(dev)
-    smu.level_i = 1e-3